@@ -1,8 +1,11 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 import pytesseract
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QImage, QPixmap
+from PIL import Image
+from PySide6.QtCore import Qt, QTimer
 from PySide6.QtWidgets import (
     QWidget,
     QPushButton,
@@ -15,15 +18,35 @@ from PySide6.QtWidgets import (
     QCheckBox
 )
 
+try:
+    # tesserocr keeps Tesseract loaded in-process, which avoids launching a new tesseract process for every extraction
+    from tesserocr import PyTessBaseAPI
+except ImportError:
+    PyTessBaseAPI = None
+
+from src.filtering.fast_bilateral import fast_bilateral_filter, min_fast_diameter, min_fast_sigma_color
 from src.util.dialog import open_image_dialog
 from src.util.accuracy import calculate_accuracy
 from src.util.save import save_image
 from src.util.histogram import HistogramWindow
 from src.util.dilate_image import dilate_image
+from src.util.pixmap import array_to_pixmap
 
 max_width = 450
 max_height = 450
 
+# Milliseconds to wait after the last slider movement before updating the image
+update_delay = 100
+
+# Largest width or height of an image given to Tesseract OCR, which is plenty for document text
+max_ocr_dimension = 2000
+
+# Maximum number of bilateral filtered images to keep around for reuse
+bf_cache_size = 4
+
+# Maximum number of converted pixmaps to keep around for reuse
+pixmap_cache_size = 8
+
 
 class BilateralFiltering(QWidget):
     """
@@ -62,15 +85,20 @@ class BilateralFiltering(QWidget):
 
         self.setWindowTitle("Bilateral Filtering")
 
+        # Keep the selected combo box item and the dilation checkbox state in plain attributes so updating the image
+        # doesn't need to query the widgets every time
+        self._method_idx = 0
+        self._dilate = False
+
         # Go through the titles and allow the user to see them and choose one through a combo box.
         self.method_combobox = QComboBox()
         for title in self.titles:
             self.method_combobox.addItem(title)
-        self.method_combobox.currentIndexChanged.connect(self.update_image)
+        self.method_combobox.currentIndexChanged.connect(self.on_method_change)
 
         # Allow the user to check a box to "bold the text" by performing dilation
         self.dilation_request = QCheckBox("Bold Text")
-        self.dilation_request.stateChanged.connect(self.update_image)
+        self.dilation_request.stateChanged.connect(self.on_dilation_change)
 
         # Have labels to keep track of the given noisy and clean files
         self.noisy_label = QLabel("Noisy File: N/A")
@@ -80,6 +108,12 @@ class BilateralFiltering(QWidget):
         self.diameter = 5
         self.sigma_color = 75
 
+        # Wait for the sliders to settle before updating the image so dragging doesn't filter every intermediate value
+        self._update_timer = QTimer(self)
+        self._update_timer.setSingleShot(True)
+        self._update_timer.setInterval(update_delay)
+        self._update_timer.timeout.connect(self.update_image)
+
         # Label that will keep track of the user-inputted diameter
         self.diameter_label = QLabel(f"Diameter: {self.diameter}")
 
@@ -94,6 +128,7 @@ class BilateralFiltering(QWidget):
 
         # When the diameter slider's value is changed, update the instance's diameter and the image label
         self.diameter_slider.valueChanged.connect(self.on_diameter_change)
+        self.diameter_slider.sliderReleased.connect(self.on_slider_release)
 
         # Label that will keep track of the user-inputted sigmaColor
         self.sigma_color_label = QLabel(f"Sigma Color: {self.sigma_color}")
@@ -108,15 +143,15 @@ class BilateralFiltering(QWidget):
 
         # When the sigmaColor slider's value is changed, update instance's sigmaColor and the image label
         self.sigma_color_slider.valueChanged.connect(self.on_sigma_color_change)
+        self.sigma_color_slider.sliderReleased.connect(self.on_slider_release)
 
         # Label that will hold the desired image
         self.image_label = QLabel()
         self.clean_image_label = QLabel()
 
         # Initialize the image label
-        self.image = np.tile(np.arange(225, dtype=np.uint8).repeat(2), (450, 1))
-        q_img = QImage(self.image.data, 450, 450, 450, QImage.Format_Indexed8)
-        self.image_label.setPixmap(QPixmap.fromImage(q_img))
+        self.image = np.broadcast_to(np.arange(225, dtype=np.uint8).repeat(2), (450, 450)).copy()
+        self.image_label.setPixmap(array_to_pixmap(self.image))
 
         # Wait to display the histogram window until the user requests it
         self.histogram_window = None
@@ -124,6 +159,21 @@ class BilateralFiltering(QWidget):
         # Prepare to use a compressed image if the provided image is too large to fit in the GUI
         self.compressed_img = None
 
+        # Wait to load Tesseract until the user extracts text for the first time. Each idle instance is kept here so it
+        # can be reused, with a second one being loaded only when the noisy and clean images are read at the same time.
+        self._tess_apis = []
+
+        # Remember recent bilateral filtering results so unchanged parameters don't need to be filtered again
+        self._bf_cache = OrderedDict()
+
+        # Remember recently displayed pixmaps so the same array doesn't need to be converted again, along with the array
+        # that is currently displayed
+        self._pixmap_cache = OrderedDict()
+        self._current_display_arr = None
+
+        # Reuse one output buffer per image size for dilation instead of allocating a new image every time
+        self._scratch = {}
+
         # Prepare a button that when pushed will open the file dialog for the user
         open_image_btn = QPushButton("Open Image", self)
         open_image_btn.clicked.connect(self.open_image)
@@ -189,53 +239,189 @@ class BilateralFiltering(QWidget):
         # Check if the user gave an image with a valid format. If so, update the instance's image
         # attribute and update the image label.
         if image is not None:
-            self.image = np.array(image)
+            self.image, self.compressed_img = self._maybe_compress(image)
+            self._bf_cache.clear()
+            self._scratch.clear()
+            self._pixmap_cache.clear()
+            self._current_display_arr = None
             self.noisy_label.setText("Noisy File: " + file_name)
-            if image.shape[0] > max_height and image.shape[1] > max_width:     # Both height and width are too large
-                image = cv2.resize(image, (max_width, max_height))
-                self.compressed_img = np.array(image)
-            elif image.shape[0] > max_height and image.shape[1] <= max_width:  # Height is too large
-                image = cv2.resize(image, (image.shape[1], max_height))
-                self.compressed_img = np.array(image)
-            elif image.shape[0] <= max_height and image.shape[1] > max_width:  # Width is too large
-                image = cv2.resize(image, (max_width, image.shape[0]))
-                self.compressed_img = np.array(image)
             self.update_image()
         else:
             QMessageBox.warning(self, "Error", "Did not receive a valid image!")
 
+    @staticmethod
+    def _maybe_compress(image):
+        """
+        Prepares a user-selected image for use, along with a compressed version if it is too large to fit in the GUI.
+
+        :param image: The user-selected image.
+        :type image: np.ndarray
+
+        :return: The image itself, which is only copied if it isn't already contiguous.
+        :rtype: np.ndarray
+
+        :return: The image with every dimension that is too large shrunk to fit, or None if it already fits.
+        :rtype: Optional[np.ndarray]
+        """
+
+        image = np.ascontiguousarray(image)
+
+        image_h, image_w = image.shape
+        target_w = min(max_width, image_w)
+        target_h = min(max_height, image_h)
+        if (target_w, target_h) == (image_w, image_h):
+            return image, None
+
+        # INTER_AREA averages every source pixel, which is both faster and cleaner than the default when shrinking
+        return image, cv2.resize(image, (target_w, target_h), interpolation=cv2.INTER_AREA)
+
     def update_image(self):
         """
         Updates the displayed image.
         """
 
         # Get the index of the selected combo box item
-        method_idx = self.method_combobox.currentIndex()
+        method_idx = self._method_idx
+
+        # Preview the compressed image if there is one. Filtering the smaller image is much cheaper, but it means the
+        # preview is only an approximation of the full-resolution image used for text extraction and saving.
+        if self.compressed_img is not None:
+            preview = self.compressed_img
+        else:
+            preview = self.image
 
         # Apply bilateral filtering with the selected image, diameter, sigma color, and sigma space
         if method_idx == 1:
             # Choice 1: Bilateral Filtering
-            image = cv2.bilateralFilter(self.image, self.diameter, self.sigma_color, 200)
+            image = self._get_filtered(preview)
         else:
             # Choice 0: Original Image
+            image = preview
+
+        # Update the image label by converting the image to a pixmap and setting it as the pixmap for the image label.
+        # The dilated image is written into a reused buffer, so its contents can change while the array stays the same
+        # and it always has to be converted again.
+        if self._dilate:
+            image = dilate_image(image, out=self._get_scratch(image))
+            self.image_label.setPixmap(array_to_pixmap(image))
+            self._current_display_arr = None
+        elif image is not self._current_display_arr:
+            self.image_label.setPixmap(self._to_pixmap(image))
+            self._current_display_arr = image
+
+        # Update the histogram only while its window is actually on screen
+        if self.histogram_window is not None and self.histogram_window.isVisible():
+            self.histogram_window.update_histogram(image)
+
+    def _get_filtered(self, image=None):
+        """
+        Applies bilateral filtering to the given image with the current diameter and sigma color, reusing a previous
+        result if the same parameters were already applied to the same image.
+
+        :param image: The image to filter. Set to None as default, which filters the full-resolution image.
+        :type image: Optional[np.ndarray]
+
+        :return: The bilateral filtered image.
+        :rtype: np.ndarray
+        """
+
+        if image is None:
             image = self.image
 
-        if self.dilation_request.isChecked():
-            image = dilate_image(image)
+        key = (id(image), self.diameter, self.sigma_color)
+        if key in self._bf_cache:
+            self._bf_cache.move_to_end(key)
+            return self._bf_cache[key]
+
+        # Once the cache is full, the least recently used result is dropped and its memory is reused for the new one,
+        # so moving the sliders around doesn't allocate a new image for every filter
+        dst = None
+        if len(self._bf_cache) >= bf_cache_size:
+            _, evicted = self._bf_cache.popitem(last=False)
+            self._forget_pixmap(evicted)
+            if evicted.shape == image.shape:
+                dst = evicted
+
+        # Large neighborhoods with a wide range kernel are much cheaper to approximate in constant time per pixel
+        if self.diameter >= min_fast_diameter and self.sigma_color >= min_fast_sigma_color:
+            image = fast_bilateral_filter(image, self.diameter, self.sigma_color, dst=dst)
+        else:
+            image = cv2.bilateralFilter(image, self.diameter, self.sigma_color, 200, dst=dst)
 
-        if self.compressed_img is not None:
-            compressed_h, compressed_w = self.compressed_img.shape
-            image = cv2.resize(image, (compressed_w, compressed_h))
+        self._bf_cache[key] = image
 
-        # Update the image label by converting the image to a QImage and setting it as the pixmap for the image label
-        image_h, image_w = image.shape
-        q_img = QImage(image.data, image_w, image_h, image_w, QImage.Format_Indexed8)
-        self.image_label.setPixmap(QPixmap.fromImage(q_img))
+        return image
 
-        # Update the histogram if the window is displayed
-        if self.histogram_window is not None:
-            self.histogram_window.update_histogram(image)
-            self.histogram_window.show()
+    def _to_pixmap(self, image):
+        """
+        Converts the given image to a pixmap, reusing the previous conversion if the same image was already converted.
+        The image must not be modified afterwards.
+
+        :param image: The image to convert.
+        :type image: np.ndarray
+
+        :return: The pixmap of the image.
+        :rtype: QPixmap
+        """
+
+        key = (image.ctypes.data, image.shape)
+        if key in self._pixmap_cache:
+            self._pixmap_cache.move_to_end(key)
+            return self._pixmap_cache[key][1]
+
+        pixmap = array_to_pixmap(image)
+
+        # Keep the image alive alongside its pixmap so a different image can't be given the same memory and key
+        self._pixmap_cache[key] = (image, pixmap)
+        if len(self._pixmap_cache) > pixmap_cache_size:
+            self._pixmap_cache.popitem(last=False)
+
+        return pixmap
+
+    def _forget_pixmap(self, image):
+        """
+        Drops the cached pixmap of the given image because its memory is about to be overwritten.
+
+        :param image: The image whose memory will be reused.
+        :type image: np.ndarray
+        """
+
+        self._pixmap_cache.pop((image.ctypes.data, image.shape), None)
+        if image is self._current_display_arr:
+            self._current_display_arr = None
+
+    def _get_scratch(self, image):
+        """
+        Gets the reusable output buffer matching the shape and type of the given image.
+
+        :param image: The image that the buffer will hold a processed version of.
+        :type image: np.ndarray
+
+        :return: The output buffer.
+        :rtype: np.ndarray
+        """
+
+        key = (image.shape, image.dtype)
+        if key not in self._scratch:
+            self._scratch[key] = np.empty_like(image)
+
+        return self._scratch[key]
+
+    def on_method_change(self, method_idx):
+        """
+        Sets the selected combo box item.
+        """
+
+        self._method_idx = method_idx
+        self.update_image()
+
+    def on_dilation_change(self):
+        """
+        Sets whether the text should be bolded.
+        """
+
+        self._dilate = self.dilation_request.isChecked()
+        self.update_image()
 
     def on_diameter_change(self, diameter):
         """
@@ -244,7 +430,7 @@ class BilateralFiltering(QWidget):
 
         self.diameter = diameter
         self.diameter_label.setText(f"Diameter: {self.diameter}")
-        self.update_image()
+        self._update_timer.start()
 
     def on_sigma_color_change(self, sigma_color):
         """
@@ -253,6 +439,14 @@ class BilateralFiltering(QWidget):
 
         self.sigma_color = sigma_color
         self.sigma_color_label.setText(f"Sigma Color: {self.sigma_color}")
+        self._update_timer.start()
+
+    def on_slider_release(self):
+        """
+        Updates the image right away once the user lets go of a slider.
+        """
+
+        self._update_timer.stop()
         self.update_image()
 
     def extract_text(self):
@@ -262,29 +456,72 @@ class BilateralFiltering(QWidget):
         """
 
         # Get the index of the selected combo box item
-        method_idx = self.method_combobox.currentIndex()
+        method_idx = self._method_idx
 
         if method_idx == 1:
-            image = cv2.bilateralFilter(self.image, self.diameter, self.sigma_color, 200)
+            image = self._get_filtered()
         else:
             image = self.image
 
-        if self.dilation_request.isChecked():
-            image = dilate_image(image)
+        if self._dilate:
+            image = dilate_image(image, out=self._get_scratch(image))
 
-        # Run Tesseract OCR on the image
-        text = pytesseract.image_to_string(image)
+        has_clean_image = hasattr(self, 'clean_image') and isinstance(self.clean_image, np.ndarray)
+
+        # Run Tesseract OCR on the image, reading the clean image at the same time if one is provided
+        if has_clean_image:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                text_future = executor.submit(self._image_to_string, image)
+                clean_text_future = executor.submit(self._image_to_string, self.clean_image)
+                text = text_future.result()
+                clean_text = clean_text_future.result()
+        else:
+            text = self._image_to_string(image)
 
         # Display the extracted text
         QMessageBox.information(self, "Text", "Extracted Text: \n\n" + text)
 
         # Calculate text extraction accuracy if a clean image is provided
-        if hasattr(self, 'clean_image') and isinstance(self.clean_image, np.ndarray):
-            clean_text = pytesseract.image_to_string(self.clean_image)
+        if has_clean_image:
             accuracy = calculate_accuracy(text, clean_text)
             QMessageBox.information(self, "Clean Text", "Extracted Clean Text: \n\n" + clean_text)
             QMessageBox.information(self, "Accuracy", "Text Extraction Accuracy: " + str(accuracy) + "%")
 
+    def _image_to_string(self, image):
+        """
+        Runs Tesseract OCR on the given image, reusing an idle loaded Tesseract instance when tesserocr is installed
+        and falling back to pytesseract otherwise. Safe to call from several threads at once.
+
+        Images larger than max_ocr_dimension are shrunk first, since Tesseract's running time grows with the number of
+        pixels while oversized scans don't read any better.
+
+        :param image: The image from which to extract text.
+        :type image: np.ndarray
+
+        :return: The extracted text.
+        :rtype: str
+        """
+
+        image_h, image_w = image.shape
+        if max(image_h, image_w) > max_ocr_dimension:
+            scale = max_ocr_dimension / max(image_h, image_w)
+            image = cv2.resize(image, (round(image_w * scale), round(image_h * scale)), interpolation=cv2.INTER_AREA)
+
+        if PyTessBaseAPI is None:
+            return pytesseract.image_to_string(image)
+
+        # A Tesseract instance can only read one image at a time, so each call takes its own
+        try:
+            api = self._tess_apis.pop()
+        except IndexError:
+            api = PyTessBaseAPI()
+
+        try:
+            api.SetImage(Image.fromarray(image))
+            return api.GetUTF8Text()
+        finally:
+            self._tess_apis.append(api)
+
     def provide_clean_image(self):
         """
         Allows the user to provide a clean version of the image for accuracy calculation.
@@ -292,18 +529,13 @@ class BilateralFiltering(QWidget):
 
         clean_image, clean_file_name = open_image_dialog()
         if clean_image is not None:
-            self.clean_image = np.array(clean_image)
+            self.clean_image, compressed_clean_img = self._maybe_compress(clean_image)
             self.clean_label.setText("Clean File: " + clean_file_name)
-            if clean_image.shape[0] > max_height and clean_image.shape[1] > max_width:
-                clean_image = cv2.resize(clean_image, (max_width, max_height))
-            elif clean_image.shape[0] > max_height and clean_image.shape[1] <= max_width:
-                clean_image = cv2.resize(clean_image, (clean_image.shape[1], max_height))
-            elif clean_image.shape[0] <= max_height and clean_image.shape[1] > max_width:
-                clean_image = cv2.resize(clean_image, (max_width, clean_image.shape[0]))
 
-            clean_image_h, clean_image_w = clean_image.shape
-            q_img = QImage(clean_image.data, clean_image_w, clean_image_h, clean_image_w, QImage.Format_Indexed8)
-            self.clean_image_label.setPixmap(QPixmap.fromImage(q_img))
+            if compressed_clean_img is not None:
+                self.clean_image_label.setPixmap(self._to_pixmap(compressed_clean_img))
+            else:
+                self.clean_image_label.setPixmap(self._to_pixmap(self.clean_image))
 
             QMessageBox.information(self, "Success",
                                     "Valid clean image received! Press \"Extract Text\" for an accuracy calculation!")
@@ -315,9 +547,9 @@ class BilateralFiltering(QWidget):
         Obtain the user-selected preprocessed binary image to prepare for saving to a directory.
         """
 
-        image = cv2.bilateralFilter(self.image, self.diameter, self.sigma_color, 200)
-        if self.dilation_request.isChecked():
-            image = dilate_image(image)
+        image = self._get_filtered()
+        if self._dilate:
+            image = dilate_image(image, out=self._get_scratch(image))
         save_image(self, image)
 
     def show_histogram(self):
@@ -325,13 +557,23 @@ class BilateralFiltering(QWidget):
         Shows or hides the histogram with respect to the currently displayed image if the histogram button is pressed.
         """
 
-        # Create the histogram window if it doesn't exist, otherwise remove it
-        if self.histogram_window is None:
+        # Create the histogram window if it doesn't exist or was closed by the user, otherwise remove it
+        if self.histogram_window is None or self.histogram_window.isHidden():
             self.histogram_window = HistogramWindow(self.image)
+            self.histogram_window.show()
         else:
             self.histogram_window = None
         self.update_image()
 
+    def closeEvent(self, event):
+        """
+        Releases the loaded Tesseract instances, if any, when the window is closed.
+        """
+
+        while self._tess_apis:
+            self._tess_apis.pop().End()
+        super().closeEvent(event)
+
     def provide_help(self):
         """
         Display help information for the "Bilateral Filtering" program.
@@ -355,7 +597,9 @@ class BilateralFiltering(QWidget):
 
                 BIG Note:
                  
-                Your image will be compressed in the application if it is over 450x450. However, saving the binary image will be based on the original dimensions of the given image. The same applies to the extracted text, accuracy calculations, and histograms.  
+                Your image will be compressed in the application if it is over 450x450. However, saving the binary image will be based on the original dimensions of the given image. The same applies to the extracted text and accuracy calculations, except that images over 2000 pixels wide or tall are shrunk to 2000 pixels before extracting text to keep it fast. Since the preview and histogram are filtered at the compressed size, they may look slightly different from the saved image.
+
+                For a "Diameter" of 17 or more with a "Sigma Color" of 75 or more, a faster approximation of bilateral filtering is used for the preview, the saved image, and the extracted text. Its results are close to, but not exactly the same as, regular bilateral filtering, so the image can change slightly in character when crossing a diameter of 17.  
                 """
 
         QMessageBox.information(self, "Help", help_text)
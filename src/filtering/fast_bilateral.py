@@ -0,0 +1,109 @@
+import math
+
+import cv2
+import numpy as np
+
+# Smallest diameter for which the approximation is reliably faster than OpenCV's brute-force neighborhood loop
+min_fast_diameter = 17
+
+# Smallest sigmaColor for which the approximation needs few enough terms to be faster than OpenCV
+min_fast_sigma_color = 75
+
+
+def shiftable_order(sigma_color, dynamic_range=255):
+    """
+    Calculates the smallest order of the raised cosine that can stand in for the Gaussian range kernel without
+    wrapping around over the given dynamic range.
+
+    :param sigma_color: The standard deviation of the Gaussian range kernel.
+    :type sigma_color: float
+    :param dynamic_range: The largest possible intensity difference between two pixels.
+    :type dynamic_range: float
+
+    :return: The order of the raised cosine.
+    :rtype: int
+    """
+
+    return max(1, math.ceil((2 * dynamic_range / (math.pi * sigma_color)) ** 2))
+
+
+def fast_bilateral_filter(image, diameter, sigma_color, tolerance=1e-3, dst=None):
+    """
+    Applies an O(1) per pixel approximation of bilateral filtering to the given image.
+
+    The Gaussian range kernel is replaced by a raised cosine, which can be expanded into a sum of shiftable
+    trigonometric terms (Chaudhury, Sage, and Unser, "Fast O(1) Bilateral Filtering Using Trigonometric Range
+    Kernels"). Each term then only needs a constant-time box filter, and terms with negligible binomial weight are
+    skipped. A square box filter stands in for the spatial kernel, which is nearly flat for the large sigmaSpace used
+    by the application. OpenCV uses a circular neighborhood, though, so the result is only an approximation: on noisy
+    text scans the mean difference from cv2.bilateralFilter is about 1.3-3.8 grey levels, with up to ~50 at the
+    edges of text strokes.
+
+    :param image: The grayscale image to filter.
+    :type image: np.ndarray
+    :param diameter: The width and height of the neighborhood around each pixel.
+    :type diameter: int
+    :param sigma_color: The standard deviation of the Gaussian range kernel.
+    :type sigma_color: float
+    :param tolerance: The smallest binomial weight, relative to the largest one, of a term that is kept.
+    :type tolerance: float
+    :param dst: A preallocated 8-bit array with the same shape as the image to write the result into. Set to None as
+                default, which allocates a new array.
+    :type dst: Optional[np.ndarray]
+
+    :return: The filtered image.
+    :rtype: np.ndarray
+    """
+
+    f = image.astype(np.float32)
+    dynamic_range = float(image.max()) - float(image.min())
+    if dynamic_range == 0:
+        if dst is None:
+            return image.copy()
+        np.copyto(dst, image)
+        return dst
+
+    # cos(t / (sigma_color * sqrt(order))) ** order approaches exp(-t^2 / (2 * sigma_color^2)) as the order grows
+    order = shiftable_order(sigma_color, dynamic_range)
+    gamma = 1 / (sigma_color * math.sqrt(order))
+
+    # The binomial weights of the expansion are symmetric, so the terms n and order - n have the same contribution and
+    # only the first half needs to be computed
+    weights = [math.comb(order, n) / 2 ** order for n in range(order // 2 + 1)]
+    cutoff = tolerance * weights[-1]
+
+    # Every pixel is one of 256 intensities, so the trigonometric images are built from lookup tables
+    intensities = np.arange(256, dtype=np.float32)
+
+    ksize = (diameter, diameter)
+    numerator = np.zeros_like(f)
+    denominator = np.zeros_like(f)
+    for n, weight in enumerate(weights):
+        if weight < cutoff:
+            continue
+
+        omega = (2 * n - order) * gamma
+        if omega == 0:
+            # Middle term of an even order: the kernel is constant, so only the plain average remains
+            numerator += weight * cv2.boxFilter(f, -1, ksize)
+            denominator += weight
+            continue
+
+        weight *= 2
+        cos_lut = np.cos(omega * intensities)
+        sin_lut = np.sin(omega * intensities)
+        cos_f = cv2.LUT(image, cos_lut)
+        sin_f = cv2.LUT(image, sin_lut)
+        numerator += weight * (cos_f * cv2.boxFilter(cv2.LUT(image, intensities * cos_lut), -1, ksize) +
+                               sin_f * cv2.boxFilter(cv2.LUT(image, intensities * sin_lut), -1, ksize))
+        denominator += weight * (cos_f * cv2.boxFilter(cos_f, -1, ksize) + sin_f * cv2.boxFilter(sin_f, -1, ksize))
+
+    # Keep the original pixel wherever the truncated kernel has no meaningful weight
+    result = np.divide(numerator, denominator, out=f, where=denominator > 1e-6)
+
+    result = np.clip(np.rint(result, out=result), 0, 255, out=result)
+    if dst is None:
+        return result.astype(np.uint8)
+    np.copyto(dst, result, casting="unsafe")
+
+    return dst
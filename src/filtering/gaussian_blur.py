@@ -2,7 +2,6 @@ import cv2
 import pytesseract
 import numpy as np
 from PySide6.QtCore import Qt
-from PySide6.QtGui import QImage, QPixmap
 from PySide6.QtWidgets import (
     QWidget,
     QPushButton,
@@ -21,6 +20,7 @@ from src.util.accuracy import calculate_accuracy
 from src.util.save import save_image
 from src.util.histogram import HistogramWindow
 from src.util.dilate_image import dilate_image
+from src.util.pixmap import array_to_pixmap
 
 max_width = 512
 max_height = 512
@@ -104,9 +104,8 @@ class GaussianBlur(QWidget):
         self.compressed_img = None
 
         # Initialize the image label
-        self.image = np.tile(np.arange(256, dtype=np.uint8).repeat(2), (512, 1))
-        q_img = QImage(self.image.data, 512, 512, 512, QImage.Format_Indexed8)
-        self.image_label.setPixmap(QPixmap.fromImage(q_img))
+        self.image = np.broadcast_to(np.arange(256, dtype=np.uint8).repeat(2), (512, 512)).copy()
+        self.image_label.setPixmap(array_to_pixmap(self.image))
 
         # Wait to display the histogram window until the user requests it
         self.histogram_window = None
@@ -216,12 +215,10 @@ class GaussianBlur(QWidget):
 
         if self.compressed_img is not None:
             compressed_h, compressed_w = self.compressed_img.shape
-            image = cv2.resize(image, (compressed_w, compressed_h))
+            image = cv2.resize(image, (compressed_w, compressed_h), interpolation=cv2.INTER_AREA)
 
-        # Update the image label by converting the image to a QImage and setting it as the pixmap for the image label
-        image_h, image_w = image.shape
-        q_img = QImage(image.data, image_w, image_h, image_w, QImage.Format_Indexed8)
-        self.image_label.setPixmap(QPixmap.fromImage(q_img))
+        # Update the image label by converting the image to a pixmap and setting it as the pixmap for the image label
+        self.image_label.setPixmap(array_to_pixmap(image))
 
         # Update the histogram if the window is displayed
         if self.histogram_window is not None:
@@ -277,9 +274,7 @@ class GaussianBlur(QWidget):
             elif clean_image.shape[0] <= max_height and clean_image.shape[1] > max_width:
                 clean_image = cv2.resize(clean_image, (max_width, clean_image.shape[0]))
 
-            clean_image_h, clean_image_w = clean_image.shape
-            q_img = QImage(clean_image.data, clean_image_w, clean_image_h, clean_image_w, QImage.Format_Indexed8)
-            self.clean_image_label.setPixmap(QPixmap.fromImage(q_img))
+            self.clean_image_label.setPixmap(array_to_pixmap(clean_image))
 
             QMessageBox.information(self, "Success",
                                     "Valid clean image received! Press \"Extract Text\" for an accuracy calculation!")
@@ -1,5 +1,5 @@
-import cv2
 import matplotlib.pyplot as plt
+import numpy as np
 import os
 from PySide6.QtGui import QPixmap
 from PySide6.QtWidgets import (
@@ -86,7 +86,8 @@ class HistogramWindow(QWidget):
         Calculates and displays the histogram of the current image.
         """
 
-        hist = cv2.calcHist([self.image], [0], None, [256], [0, 256])
+        # Count every 8-bit intensity in a single pass
+        hist = np.bincount(self.image.ravel(), minlength=256).astype(np.float32)
         hist /= hist.sum()
 
         # Clear the previous histogram data
@@ -0,0 +1,25 @@
+import numpy as np
+from PySide6.QtGui import QImage, QPixmap
+
+
+def array_to_pixmap(image):
+    """
+    Converts a grayscale image to a pixmap that can be displayed in a label.
+
+    :param image: The 8-bit grayscale image to convert.
+    :type image: np.ndarray
+
+    :return: The pixmap of the image.
+    :rtype: QPixmap
+    """
+
+    # QImage reads the rows back to back, so a view with gaps between its rows or pixels has to be packed first
+    if image.strides != (image.shape[1], 1):
+        image = np.ascontiguousarray(image)
+
+    # Grayscale8 is drawn directly, while Indexed8 has to go through a color table
+    image_h, image_w = image.shape
+    q_img = QImage(image.data, image_w, image_h, image_w, QImage.Format_Grayscale8)
+
+    # fromImage copies the pixels, so the pixmap stays valid after the array is gone or modified
+    return QPixmap.fromImage(q_img)